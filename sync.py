@@ -1,53 +1,314 @@
 import os
 import time
 import subprocess
-import argparse
-import datetime
+import atexit
+import functools
 import sys
-import json
 import logging
-import platform
+import queue
+import shlex
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Optional: OS-level file watching. Falls back to mtime scans when missing.
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# Optional: libgit2 bindings for in-process status checks (no subprocess).
+try:
+    import pygit2
+except ImportError:
+    pygit2 = None
+
+# Optional: .gitignore matching so watcher events for ignored files
+# (plugin caches, build outputs) don't reset the idle timer.
+try:
+    import pathspec
+except ImportError:
+    pathspec = None
+
+# Optional: C-backed JSON for config/state files.
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Constants
 CONFIG_FILE = "config.json"
+STATE_FILE = "sync_state.json"  # Per-repo clean snapshots, survives restarts
 LOG_FILE = "sync.log"
 DEFAULT_INTERVAL = 20
+MAX_INTERVAL = 300  # Cap for the adaptive polling backoff
 DEFAULT_IDLE_THRESHOLD = 60
+DEFAULT_PULL_INTERVAL = 300  # Seconds between remote pulls while the vault is clean
 BATCH_SIZE = 500  # Number of files per commit during large/initial sync
 
-# Setup Logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE, encoding='utf-8'),
+# Obsidian rewrites these on every pane focus; even when a vault's
+# .gitignore doesn't exclude them, their churn must not reset the idle
+# timer or syncs would never fire for an active user.
+IGNORED_NAMES = {"workspace", "workspace-mobile", ".DS_Store"}
+
+# On Linux + Python 3.10+, widen subprocess pipes from the 64KB default
+# so large status outputs drain in fewer reads/wakeups.
+if sys.version_info >= (3, 10) and sys.platform == "linux":
+    _PIPE_KWARGS = {"pipesize": 1_048_576}
+else:
+    _PIPE_KWARGS = {}
+
+# Hot-path git invocations, built once instead of on every poll. The
+# leading "git" (plus explicit --git-dir/--work-tree) is prepended per
+# instance; see GitSync._git_base.
+PULL_CMD = ("pull", "--rebase")
+DIFF_INDEX_CMD = ("--no-optional-locks", "diff-index", "--quiet", "HEAD", "--")
+LS_FILES_CMD = ("--no-optional-locks", "ls-files", "--others", "--exclude-standard", "-z")
+SYMBOLIC_REF_CMD = ("--no-optional-locks", "symbolic-ref", "-q", "HEAD")
+
+# Setup Logging. Records go through a queue to a background listener
+# thread, so the sync loop never blocks on disk writes. Guarded so a
+# second import (e.g. script run plus `import sync`) doesn't stack a
+# duplicate handler/listener pair that would double every log line.
+if not logging.getLogger().handlers:
+    _log_queue = queue.Queue(-1)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[QueueHandler(_log_queue)]
+    )
+    _log_listener = QueueListener(
+        _log_queue,
+        # delay=True: don't open (and dirty) the log file until the first record.
+        RotatingFileHandler(LOG_FILE, maxBytes=1_000_000, backupCount=3, encoding='utf-8', delay=True),
         logging.StreamHandler(sys.stdout)
-    ]
-)
+    )
+    _log_listener.start()
+    atexit.register(_log_listener.stop)  # Drain queued records on shutdown.
 logger = logging.getLogger("GitSync")
 
+@functools.lru_cache(maxsize=8)
+def _is_git_repo(path):
+    """Single cached stat for "does path/.git exist?"."""
+    try:
+        os.stat(os.path.join(path, ".git"))
+        return True
+    except OSError:
+        return False
+
+class VaultEventHandler(FileSystemEventHandler):
+    """Updates the syncer's last-event timestamp on filesystem activity."""
+
+    def __init__(self, syncer):
+        self.syncer = syncer
+        # .git lives only at the vault root, so one precomputed prefix
+        # check beats scanning every event path for the substring.
+        self._git_dir = os.path.join(syncer.repo_path, ".git")
+        self._git_prefix = self._git_dir + os.sep
+
+    def on_any_event(self, event):
+        path = event.src_path
+        if path == self._git_dir or path.startswith(self._git_prefix):
+            return
+        name = os.path.basename(path)
+        if name in IGNORED_NAMES:
+            return
+        # Ignore our own log file (and its rotated siblings) in case the
+        # vault and the script share a directory.
+        if name.startswith(LOG_FILE):
+            return
+        spec = self.syncer.ignore_spec
+        if spec is not None:
+            rel = os.path.relpath(path, self.syncer.repo_path)
+            if spec.match_file(rel):
+                return
+        now = time.time()
+        self.syncer.last_event_time = now
+        self.syncer._event_times.append(now)
+        self.syncer.schedule_sync()
+
 class GitSync:
     def __init__(self, repo_path, idle_threshold=DEFAULT_IDLE_THRESHOLD, remote_url=None):
         self.repo_path = os.path.abspath(repo_path)
+        self._git_dir = os.path.join(self.repo_path, ".git")
+        # Explicit --git-dir/--work-tree skip git's per-invocation repo
+        # discovery walk up the directory tree.
+        self._git_base = ("git", "--git-dir", self._git_dir, "--work-tree", self.repo_path)
+        self._diff_index_cmd = self._git_base + DIFF_INDEX_CMD
+        self._ls_files_cmd = self._git_base + LS_FILES_CMD
+        self._symbolic_ref_cmd = self._git_base + SYMBOLIC_REF_CMD
         self.idle_threshold = idle_threshold
         self.remote_url = remote_url
         self.interval = DEFAULT_INTERVAL
+        self.max_interval = MAX_INTERVAL
+        self._idle_ticks = 0
+        self._consecutive_failures = 0
+        self.pull_interval = DEFAULT_PULL_INTERVAL
+        self._last_pull = 0.0
         self.pending_changes_since = None
+        self._identity_ok = False
+        self.last_event_time = None
+        self._event_times = deque(maxlen=64)  # Recent watcher event times
+        # On POSIX, keep an fd on the vault root so idle-scan stats run as
+        # fstatat relative to it, skipping path resolution for every file.
+        self._root_fd = None
+        if os.stat in os.supports_dir_fd:
+            try:
+                self._root_fd = os.open(self.repo_path, os.O_RDONLY)
+            except OSError:
+                self._root_fd = None
+        self.ignore_spec = self._load_gitignore()
+        self._sync_lock = threading.Lock()
+        # libgit2 repository objects are not safe for concurrent use; the
+        # tick thread and the network worker both reach _repo, so its
+        # access is serialized (contenders fall back to the git CLI).
+        self._repo_lock = threading.Lock()
+        # Single worker so pushes serialize; commit_and_push drops a new
+        # submit while one is still in flight instead of queueing dupes.
+        self._push_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="push")
+        self._push_future = None
+        self._debounce_timer = None
+        self._observer = None
+        if Observer is not None:
+            self._start_watcher()
+        self._is_bare = False
+        self._detached_warned = False
+        try:
+            self._is_bare = self.run_git(["--no-optional-locks", "rev-parse", "--is-bare-repository"], check=False) == "true"
+        except Exception:
+            pass
+        if self._is_bare:
+            logger.warning(f"{self.repo_path} is a bare repository (no working tree). Sync is disabled.")
+        self._ahead = False
+        self._clean_marker = None
+        self._packed_refs = None  # (packed-refs mtime_ns, {ref: sha}) cache
+        self._repo = None
+        if pygit2 is not None:
+            try:
+                self._repo = pygit2.Repository(self.repo_path)
+            except Exception:
+                # Not a repo (yet); read-only checks fall back to the CLI.
+                self._repo = None
+        # Seed the cached ahead flag once from the consolidated status call;
+        # after that it is maintained by get_sync_state, pulls and push
+        # results instead of separate rev-list spawns. A restart where
+        # nothing moved skips even that one call by matching the clean
+        # snapshot persisted at the last clean tick.
+        self._persisted_state = None
+        if self.is_git_repo() and not self._is_bare:
+            state = _load_state().get(self.repo_path)
+            snapshot = self._index_snapshot()
+            if state and snapshot is not None and snapshot == tuple(state.get("snapshot", ())):
+                self._ahead = bool(state.get("ahead", False))
+                self._persisted_state = (snapshot, self._ahead)
+            else:
+                self.get_sync_state()
+
+    def _load_gitignore(self):
+        """Parses the vault's .gitignore into a pathspec matcher (or None).
+
+        Only used to filter file-watcher events; the git status path
+        already honors ignore rules by itself.
+        """
+        if pathspec is None:
+            return None
+        try:
+            with open(os.path.join(self.repo_path, ".gitignore"), encoding="utf-8") as f:
+                return pathspec.PathSpec.from_lines("gitwildmatch", f)
+        except OSError:
+            return None
 
-    def run_git(self, args, check=True):
-        """Executes a git command in the repository."""
+    def _start_watcher(self):
+        """Starts an OS-level file watcher so idle polls don't rescan the vault."""
         try:
+            observer = Observer()
+            observer.daemon = True
+            observer.schedule(VaultEventHandler(self), self.repo_path, recursive=True)
+            observer.start()
+        except Exception as e:
+            logger.warning(f"File watcher unavailable ({e}). Falling back to mtime scans.")
+            return
+        self._observer = observer
+
+    def _ensure_watcher(self):
+        """Restarts the watcher if its thread died (e.g. the watch was dropped)."""
+        if self._observer is not None and not self._observer.is_alive():
+            logger.warning("File watcher stopped. Restarting it...")
+            self._observer = None
+            self._start_watcher()
+
+    def tune_repo_config(self):
+        """Enables git's own status accelerators on supported versions.
+
+        core.fsmonitor=true makes git run its builtin file-watcher daemon so
+        status answers from an event log instead of lstat-ing the whole
+        worktree; untrackedCache and manyFiles/index v4 speed up the
+        remaining scans. All of this needs git >= 2.37, so older versions
+        are left untouched.
+        """
+        import platform
+        try:
+            # Third token, not last: Apple git reports e.g.
+            # "git version 2.39.3 (Apple Git-145)".
+            version = self.run_git(["--version"], check=False)
+            parts = version.split()[2].split(".")
+            if (int(parts[0]), int(parts[1])) < (2, 37):
+                return
+        except Exception:
+            return
+        settings = [
+            ("core.untrackedcache", "true"),
+            ("feature.manyFiles", "true"),
+            ("index.version", "4"),
+        ]
+        if platform.system() in ("Windows", "Darwin"):
+            # The builtin fsmonitor daemon only ships for these platforms.
+            settings.append(("core.fsmonitor", "true"))
+        for key, value in settings:
+            self.run_git(["config", key, value], check=False, capture=False)
+
+    def run_git(self, args, check=True, binary=False, capture=True, discard_output=False):
+        """Executes a git command in the repository.
+
+        With binary=True, stdout stays as bytes - skips the locale decode
+        for output that is only tested, never displayed.
+        With capture=False, stdout goes to /dev/null for fire-and-forget
+        commands (add/commit/push) whose output is never read; stderr is
+        still captured for error reporting.
+        With discard_output=True, both streams go to /dev/null - no pipe
+        buffers at all, for calls where only the exit status matters.
+        """
+        try:
+            if binary:
+                text_kwargs = {}
+            else:
+                text_kwargs = {"text": True, "errors": "replace"}  # Handle non-utf-8 output
+            if discard_output:
+                io_kwargs = {"stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL}
+            elif capture:
+                io_kwargs = {"capture_output": True}
+            else:
+                io_kwargs = {"stdout": subprocess.DEVNULL, "stderr": subprocess.PIPE}
+            # Skip git's repo-discovery walk once .git exists; before that
+            # (init, --version) plain "git" with cwd discovery is correct.
+            base = self._git_base if _is_git_repo(self.repo_path) else ("git",)
             result = subprocess.run(
-                ["git"] + args,
+                [*base, *args],
                 cwd=self.repo_path,
                 check=check,
-                capture_output=True,
-                text=True,
-                errors='replace' # Handle non-utf-8 output
+                close_fds=False,  # Skip the O(ulimit) fd sweep; enables posix_spawn.
+                **_PIPE_KWARGS,
+                **io_kwargs,
+                **text_kwargs
             )
-            return result.stdout.strip()
+            return result.stdout.strip() if capture and not discard_output else None
         except subprocess.CalledProcessError as e:
-            error_msg = e.stderr.strip()
+            error_msg = e.stderr.strip() if e.stderr else ""
+            if binary:
+                error_msg = os.fsdecode(error_msg)
             if "up to date" not in error_msg and "no changes" not in error_msg:
                 logger.debug(f"Git command failed: {' '.join(args)} | Error: {error_msg}")
             # Attach stderr to the exception so callers can see it
@@ -58,15 +319,36 @@ class GitSync:
             raise
 
     def is_git_repo(self):
-        return os.path.isdir(os.path.join(self.repo_path, ".git"))
+        return _is_git_repo(self.repo_path)
 
     def initialize_repo(self):
         """Initializes git repo and sets remote if provided."""
         logger.info(f"Initializing git repository in {self.repo_path}...")
         try:
-            self.run_git(["init"])
-            self.run_git(["branch", "-M", "main"], check=False)
-            
+            # Chain the setup commands into one shell invocation instead of
+            # paying fork/exec for each. The initial add/commit/push stays
+            # separate because large vaults go through the batch uploader.
+            cmds = ["git init"]
+            if self.remote_url:
+                if os.name == "nt":
+                    quoted_url = f'"{self.remote_url}"'
+                else:
+                    quoted_url = shlex.quote(self.remote_url)
+                cmds.append(f"git remote add origin {quoted_url}")
+            cmds.append("git branch -M main")
+            subprocess.run(
+                " && ".join(cmds),
+                cwd=self.repo_path,
+                shell=True,
+                check=False,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+            _is_git_repo.cache_clear()  # The cached "no .git here" answer is now stale.
+            self.tune_repo_config()
+            if self.remote_url:
+                logger.info(f"Added remote origin: {self.remote_url}")
+
             # Create .gitignore if not exists
             gitignore_path = os.path.join(self.repo_path, ".gitignore")
             if not os.path.exists(gitignore_path):
@@ -74,10 +356,6 @@ class GitSync:
                     f.write(".obsidian/workspace\n.obsidian/workspace-mobile\n.DS_Store\n")
                 logger.info("Created default .gitignore")
 
-            if self.remote_url:
-                self.run_git(["remote", "add", "origin", self.remote_url], check=False)
-                logger.info(f"Added remote origin: {self.remote_url}")
-            
             # Initial commit (using batching)
             modified_files = self.get_modified_files()
             if modified_files:
@@ -85,10 +363,10 @@ class GitSync:
                 self.commit_and_push_batches(modified_files)
             else:
                 # If no files found via status (unlikely for new repo), still try a dummy push
-                self.run_git(["add", "."])
-                self.run_git(["commit", "-m", "Initial commit from Obsidian Git Sync"], check=False)
+                self.run_git(["add", "."], capture=False)
+                self.run_git(["commit", "-m", "Initial commit from Obsidian Git Sync"], check=False, capture=False)
                 try:
-                    self.run_git(["push", "-u", "origin", "main"], check=True)
+                    self.run_git(["push", "-u", "origin", "main"], check=True, capture=False)
                     logger.info("Initial push successful.")
                 except Exception as e:
                     logger.warning(f"Initial push failed: {e}. It will retry during normal sync.")
@@ -98,40 +376,235 @@ class GitSync:
         except Exception as e:
             logger.error(f"Failed to initialize repository: {e}")
 
-    def get_modified_files(self):
-        """Returns a list of modified files using git status."""
+    def _index_snapshot(self):
+        """Cheap proxy for git-side activity: (index mtime, root mtime), or None.
+
+        .git/index is restamped by any staging/commit, and the vault root's
+        mtime changes on top-level adds/removes. Two stat syscalls total.
+        """
         try:
-            status = self.run_git(["status", "--porcelain"])
-            if not status:
-                return []
-            
-            files = []
-            for line in status.splitlines():
-                if len(line) > 3:
-                    file_path = line[3:].strip()
-                    if file_path.startswith('"') and file_path.endswith('"'):
-                        file_path = file_path[1:-1]
-                    files.append(file_path)
-            return files
+            return (
+                os.stat(os.path.join(self._git_dir, "index")).st_mtime_ns,
+                os.stat(self.repo_path).st_mtime_ns
+            )
+        except OSError:
+            return None
+
+    def _mark_clean(self):
+        """Records the state that future ticks may skip git for entirely."""
+        snapshot = self._index_snapshot()
+        self._clean_marker = (snapshot, self.last_event_time)
+        # The burst that led here is over; resumed typing must build its
+        # own median rather than be outvoted by pre-sync timestamps.
+        self._event_times.clear()
+        self._persist_state(snapshot)
+
+    def _persist_state(self, snapshot=None):
+        """Rewrites sync_state.json when the snapshot or the ahead flag moved.
+
+        Gating on both matters: a successful push changes neither index nor
+        root mtime, so a snapshot-only gate would persist a stale
+        ahead=True and make every restart re-attempt a push it doesn't owe.
+        """
+        if snapshot is None:
+            snapshot = self._index_snapshot()
+        if snapshot is not None and (snapshot, self._ahead) != self._persisted_state:
+            self._persisted_state = (snapshot, self._ahead)
+            _update_state(self.repo_path, snapshot, self._ahead)
+
+    def _still_clean(self):
+        """True when nothing moved since the last known-clean state.
+
+        Only trusted while the file watcher is running: the marker pairs
+        the .git/index snapshot (catches git activity from other tools)
+        with the last watcher event (catches worktree edits). Without the
+        watcher, deep edits would not show up in either stat.
+        """
+        if self._observer is None or self._clean_marker is None:
+            return False
+        return self._clean_marker == (self._index_snapshot(), self.last_event_time)
+
+    def has_changes(self):
+        """Fast dirty check that avoids a full `git status` on the clean path.
+
+        `diff-index --quiet` exits 0 when tracked files are unchanged;
+        untracked files are caught separately via `ls-files --others`.
+        `--no-optional-locks` keeps both calls read-only so background
+        polls never refresh and rewrite the index.
+        """
+        if self._repo is not None and self._repo_lock.acquire(blocking=False):
+            try:
+                # In-process via libgit2: no fork/exec at all.
+                return any(
+                    flags != pygit2.GIT_STATUS_CURRENT
+                    and not flags & pygit2.GIT_STATUS_IGNORED
+                    for flags in self._repo.status().values()
+                )
+            except Exception:
+                pass  # Fall back to the git CLI below.
+            finally:
+                self._repo_lock.release()
+        result = subprocess.run(
+            self._diff_index_cmd,
+            cwd=self.repo_path,
+            close_fds=False,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        if result.returncode != 0:
+            # Dirty tracked files (or no HEAD yet, which also needs a sync).
+            return True
+        return bool(self.get_untracked_files())
+
+    def get_untracked_files(self):
+        """Returns untracked (non-ignored) files via ls-files."""
+        result = subprocess.run(
+            self._ls_files_cmd,
+            cwd=self.repo_path,
+            close_fds=False,
+            capture_output=True
+        )
+        return [os.fsdecode(p) for p in result.stdout.split(b"\0") if p]
+
+    def _pygit2_sync_state(self):
+        """get_sync_state via libgit2: no subprocess, no index reload."""
+        status = self._repo.status()
+        files = [
+            path for path, flags in status.items()
+            if flags != pygit2.GIT_STATUS_CURRENT and not flags & pygit2.GIT_STATUS_IGNORED
+        ]
+        ahead = False
+        if not self._repo.head_is_unborn and not self._repo.head_is_detached:
+            branch = self._repo.branches.local.get(self._repo.head.shorthand)
+            upstream = branch.upstream if branch is not None else None
+            if upstream is not None:
+                ahead = self._repo.ahead_behind(self._repo.head.target, upstream.target)[0] > 0
+        return files, ahead
+
+    def get_sync_state(self):
+        """Returns (modified_files, ahead) from a single git invocation.
+
+        Prefers the in-process libgit2 path when pygit2 is available;
+        otherwise `status --branch --porcelain=v2 -z` emits the branch.ab
+        ahead/behind header and the NUL-terminated file records in one
+        run, replacing the separate status and rev-list spawns.
+        """
+        files = []
+        ahead = False
+        if self._repo is not None and self._repo_lock.acquire(blocking=False):
+            try:
+                files, ahead = self._pygit2_sync_state()
+                self._ahead = ahead
+                return files, ahead
+            except Exception:
+                pass  # Fall back to the git CLI below.
+            finally:
+                self._repo_lock.release()
+        try:
+            out = self.run_git(
+                ("--no-optional-locks", "status", "--branch", "--porcelain=v2", "-z"),
+                binary=True
+            )
         except Exception:
-            return []
+            return files, ahead
+        if not out:
+            return files, ahead
+
+        records = out.split(b"\0")
+        i = 0
+        while i < len(records):
+            rec = records[i]
+            i += 1
+            if not rec:
+                continue
+            tag = rec[:1]
+            if tag == b"#":
+                if rec.startswith(b"# branch.ab "):
+                    # "# branch.ab +<ahead> -<behind>"
+                    try:
+                        ahead = int(rec.split(b" ")[2]) > 0
+                    except (IndexError, ValueError):
+                        pass
+            elif tag == b"?":
+                files.append(os.fsdecode(rec[2:]))
+            elif tag == b"1":
+                files.append(os.fsdecode(rec.split(b" ", 8)[8]))
+            elif tag == b"2":
+                files.append(os.fsdecode(rec.split(b" ", 9)[9]))
+                i += 1  # The rename source follows as its own NUL field.
+            elif tag == b"u":
+                files.append(os.fsdecode(rec.split(b" ", 10)[10]))
+        self._ahead = ahead
+        return files, ahead
+
+    def get_modified_files(self):
+        """Returns a list of modified files using git status."""
+        files, _ = self.get_sync_state()
+        return files
+
+    def is_idle(self, files):
+        """Checks whether every modified file is older than the idle threshold.
+
+        Returns a (idle, idle_time) tuple. Short-circuits as soon as any
+        file is newer than the cutoff, so the common "user is still typing"
+        case stops after the first fresh file instead of statting them all.
+        """
+        if self._observer is not None and self.last_event_time is not None:
+            # Event-driven fast path: no stats at all. The median of recent
+            # event times, not the single newest, measures idleness - a
+            # background indexer touching one stray file every few seconds
+            # would otherwise keep the vault "active" and starve the sync.
+            # Drop leftovers from a previous activity burst first: stale
+            # timestamps would outvote fresh typing and report an active
+            # vault as idle.
+            now = time.time()
+            cutoff = now - 2 * self.idle_threshold
+            while self._event_times and self._event_times[0] < cutoff:
+                self._event_times.popleft()
+            if self._event_times:
+                import statistics
+                idle_time = now - statistics.median(self._event_times)
+            else:
+                idle_time = now - self.last_event_time
+            return idle_time >= self.idle_threshold, idle_time
 
-    def get_latest_mtime(self, files):
-        """Gets the most recent modification time among the specified files."""
-        max_mtime = 0
+        # Integer nanosecond comparisons: no float object per stat and no
+        # precision loss on sub-second mtimes from NTFS/APFS.
+        now_ns = time.time_ns()
+        cutoff_ns = now_ns - int(self.idle_threshold * 1e9)
+        latest_ns = 0
         for rel_path in files:
-            full_path = os.path.join(self.repo_path, rel_path)
-            if os.path.exists(full_path):
-                try:
-                    mtime = os.path.getmtime(full_path)
-                    if mtime > max_mtime:
-                        max_mtime = mtime
-                except OSError:
-                    pass
-        return max_mtime
-
-    def check_identity(self):
-        """Checks if Git user.email and user.name are configured."""
+            if os.path.basename(rel_path) in IGNORED_NAMES:
+                continue
+            try:
+                if self._root_fd is not None:
+                    mtime_ns = os.stat(rel_path, dir_fd=self._root_fd).st_mtime_ns
+                else:
+                    mtime_ns = os.stat(os.path.join(self.repo_path, rel_path)).st_mtime_ns
+            except OSError:
+                # File may have been deleted between status and stat.
+                continue
+            if mtime_ns > cutoff_ns:
+                return False, (now_ns - mtime_ns) / 1e9
+            if mtime_ns > latest_ns:
+                latest_ns = mtime_ns
+
+        if latest_ns == 0:
+            # If we can't get any mtime (e.g. all files deleted),
+            # use the time we first detected the change to trigger sync.
+            latest_ns = int((self.pending_changes_since or time.time()) * 1e9)
+        idle_time = (now_ns - latest_ns) / 1e9
+        return idle_time >= self.idle_threshold, idle_time
+
+    def check_identity(self, force=False):
+        """Checks if Git user.email and user.name are configured.
+
+        The result is cached: identity almost never changes at runtime, so
+        after the first success this returns without spawning git. Pass
+        force=True (e.g. from an explicit setup/repair) to re-check.
+        """
+        if self._identity_ok and not force:
+            return
         try:
             email = self.run_git(["config", "user.email"], check=False)
             name = self.run_git(["config", "user.name"], check=False)
@@ -148,7 +621,9 @@ class GitSync:
             
             # Ensure Git doesn't quote non-ASCII filenames (fixes sync hang with Chinese names)
             self.run_git(["config", "core.quotepath", "false"], check=False)
+            self._identity_ok = True
         except Exception as e:
+            self._identity_ok = False
             logger.error(f"Error checking identity: {e}")
 
     def repair_connection(self):
@@ -175,7 +650,7 @@ class GitSync:
         logger.info("4. Attempting to push with upstream tracking...")
         try:
             # First try a normal push
-            self.run_git(["push", "--set-upstream", "origin", "main"], check=True)
+            self.run_git(["push", "--set-upstream", "origin", "main"], check=True, capture=False)
             logger.info("Repair completed successfully!")
         except Exception as e:
             logger.info(f"Standard push failed ({e}). Attempting to sync with remote history...")
@@ -189,74 +664,217 @@ class GitSync:
                 if len(modified_files) > BATCH_SIZE:
                     self.commit_and_push_batches(modified_files)
                 else:
-                    self.run_git(["push", "-u", "origin", "main"], check=True)
+                    self.run_git(["push", "-u", "origin", "main"], check=True, capture=False)
                 logger.info("Repair completed successfully after synchronization!")
             except Exception as final_e:
                 logger.error(f"Repair failed: {final_e}")
                 logger.warning("TIP: Check if your GitHub repository is initialized and your internet connection is stable.")
 
-    def is_ahead(self):
-        """Checks if there are local commits not yet pushed to remote."""
+    def schedule_sync(self):
+        """(Re)arms a debounce timer that syncs once the vault goes idle.
+
+        Each filesystem event cancels the previous timer, so the sync fires
+        exactly idle_threshold seconds after the last change, with no
+        polling in between.
+        """
+        if self._debounce_timer is not None:
+            self._debounce_timer.cancel()
+        # The small margin keeps timer jitter from firing a hair before the
+        # idle cutoff, which would find the vault "not idle yet" and leave
+        # the change waiting for the (backed-off) poll loop instead.
+        timer = threading.Timer(self.idle_threshold + 0.2, self._debounced_sync)
+        timer.daemon = True
+        timer.start()
+        self._debounce_timer = timer
+
+    def _debounced_sync(self):
         try:
-            ahead = self.run_git(["rev-list", "--count", "origin/main..main"], check=False)
-            if ahead and ahead.isdigit() and int(ahead) > 0:
-                return True
-        except Exception:
-            pass
+            self.sync()
+        except Exception as e:
+            logger.error(f"Debounced sync failed: {e}")
+
+    def _is_detached_head(self):
+        """True when HEAD is not on a branch (pull --rebase/push are unsafe)."""
+        result = subprocess.run(
+            self._symbolic_ref_cmd,
+            cwd=self.repo_path,
+            close_fds=False,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        if result.returncode != 0:
+            if not self._detached_warned:
+                logger.warning("HEAD is detached. Skipping pull/push until a branch is checked out.")
+                self._detached_warned = True
+            return True
+        self._detached_warned = False
         return False
 
     def sync(self):
         """Main check and sync logic."""
-        self.check_identity()
-        
-        modified_files = self.get_modified_files()
-        ahead = self.is_ahead()
+        if not self._sync_lock.acquire(blocking=False):
+            # A sync for this repo is already in flight (debounce timer or
+            # another pool worker); skip this tick instead of piling up.
+            return
+        try:
+            if self._is_bare:
+                return
+            self._ensure_watcher()
 
-        if modified_files:
-            current_time = time.time()
-            last_mtime = self.get_latest_mtime(modified_files)
-            
-            if last_mtime == 0:
-                # If we can't get mtime (e.g. all files deleted), 
-                # use the time we first detected the change to trigger sync.
-                if self.pending_changes_since:
-                    last_mtime = self.pending_changes_since
-                else:
-                    last_mtime = current_time
+            if self._still_clean():
+                # The tick right after a commit (or any quiet stretch):
+                # two stats instead of any git spawn.
+                modified_files, ahead = [], self._ahead
+            elif self.has_changes():
+                modified_files, ahead = self.get_sync_state()
+            else:
+                modified_files, ahead = [], self._ahead
 
-            idle_time = current_time - last_mtime
+            if modified_files or ahead:
+                self._idle_ticks = 0
+            else:
+                self._idle_ticks += 1
 
-            if idle_time >= self.idle_threshold:
-                logger.info(f"Idle for {int(idle_time)}s. Syncing {len(modified_files)} changes...")
-                if len(modified_files) > BATCH_SIZE:
-                    self.commit_and_push_batches(modified_files)
+            if modified_files:
+                idle, idle_time = self.is_idle(modified_files)
+
+                if idle:
+                    logger.info(f"Idle for {int(idle_time)}s. Syncing {len(modified_files)} changes...")
+                    if len(modified_files) > BATCH_SIZE:
+                        self.commit_and_push_batches(modified_files)
+                    else:
+                        self.commit_and_push(modified_files)
+                    self.pending_changes_since = None
+                    self._mark_clean()
                 else:
-                    self.commit_and_push()
-                self.pending_changes_since = None
+                    if self.pending_changes_since is None:
+                        self.pending_changes_since = time.time()
+                        logger.info(f"Changes detected. Waiting for idle ({self.idle_threshold}s)...")
+            elif ahead:
+                logger.info("Local commits detected that are not on GitHub. Retrying push...")
+                self.commit_and_push()
             else:
-                if self.pending_changes_since is None:
-                    self.pending_changes_since = current_time
-                    logger.info(f"Changes detected. Waiting for idle ({self.idle_threshold}s)...")
-        elif ahead:
-            logger.info("Local commits detected that are not on GitHub. Retrying push...")
-            self.commit_and_push()
-        else:
-            self.pending_changes_since = None
-            self.pull_changes()
+                self.pending_changes_since = None
+                self._mark_clean()
+                # Clean tree: only hit the network once per pull_interval,
+                # not on every poll tick. The pull runs on the network
+                # worker so remote latency overlaps the next ticks' local
+                # checks; sharing the push future keeps pulls and pushes
+                # serialized on that single worker.
+                if time.time() - self._last_pull > self.pull_interval:
+                    if self._push_future is None or self._push_future.done():
+                        self._push_future = self._push_executor.submit(self.pull_changes)
+        finally:
+            self._sync_lock.release()
+
+    def next_interval(self):
+        """Seconds to sleep before the next poll.
 
-    def commit_and_push(self):
+        Backs off 1.5x per consecutive clean tick (capped at max_interval)
+        so an idle vault is polled a handful of times per hour instead of
+        constantly; activity resets to the base interval. After three
+        consecutive sync failures the circuit breaker pins the delay to
+        the cap so a broken remote isn't hammered.
+        """
+        if self._consecutive_failures >= 3:
+            return self.max_interval
+        # Cap the exponent: _idle_ticks grows forever on an idle vault and
+        # 1.5 ** n overflows past n ~= 1750; 20 ticks already exceeds any
+        # sensible max_interval.
+        return min(self.max_interval, self.interval * (1.5 ** min(self._idle_ticks, 20)))
+
+    def commit_and_push(self, files=None):
+        if self._is_detached_head():
+            return
         try:
-            self.run_git(["add", "."])
-            timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            self.run_git(["commit", "-m", f"Auto sync: {timestamp}"], check=False)
-            
+            if files:
+                # Stage exactly what status reported (100 paths per spawn to
+                # stay clear of ARG_MAX) instead of letting git rescan the
+                # worktree; `git add` also stages deletions for known paths.
+                for i in range(0, len(files), 100):
+                    self.run_git(["add", "--"] + files[i:i + 100], check=False, capture=False)
+            else:
+                # No list available (e.g. push retry): `commit -a` below
+                # stages tracked changes, so only untracked files need an add.
+                untracked = self.get_untracked_files()
+                if untracked:
+                    self.run_git(["add", "--"] + untracked, check=False, capture=False)
+
+            # Obsidian plugins sometimes rewrite files byte-identical (an
+            # mtime-only touch). If neither the index nor the worktree really
+            # differs from HEAD, don't commit - and unless a push is still
+            # owed, skip the network round-trip entirely.
+            changed = subprocess.run(
+                [*self._git_base, "--no-optional-locks", "diff", "--quiet", "HEAD", "--"],
+                cwd=self.repo_path,
+                close_fds=False,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            ).returncode != 0
+            if changed:
+                timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+                if files:
+                    # Everything is staged already; plain commit skips the
+                    # tracked-file refresh that -a would redo.
+                    commit_args = ["-c", "gc.auto=0", "commit", "--quiet",
+                                   "-m", f"Auto sync: {timestamp}"]
+                else:
+                    commit_args = ["-c", "gc.auto=0", "commit", "-a", "--quiet",
+                                   "-m", f"Auto sync: {timestamp}"]
+                self.run_git(commit_args, check=False, capture=False)
+            else:
+                # Rewrite the stat cache so mtime-only touches stop showing
+                # up as dirty on future ticks.
+                self.run_git(["update-index", "-q", "--refresh"], check=False, capture=False)
+                if not self._ahead:
+                    logger.info("No content changes detected. Skipping sync.")
+                    return
+
             self.pull_changes()
-            
-            logger.info("Pushing to remote...")
-            self.run_git(["push"])
-            logger.info("Push successful.")
+
+            # Hand the network round-trip to the background worker so a slow
+            # or flaky remote can't stall change detection. A push already in
+            # flight is left alone; _ahead stays set until one succeeds, so a
+            # dropped submit is retried on the next tick.
+            self._ahead = True
+            if self._push_future is None or self._push_future.done():
+                self._push_future = self._push_executor.submit(self._do_push)
         except Exception as e:
+            self._ahead = True  # Assume a push is still owed; retried next tick.
+            self._consecutive_failures += 1
             logger.error(f"Sync failed: {e}")
+            if self._consecutive_failures == 3:
+                logger.error(f"Three syncs failed in a row. Backing off to {self.max_interval}s polls until one succeeds.")
+
+    def _do_push(self):
+        """Pushes to the remote on the push worker, retrying with backoff.
+
+        Runs off the sync thread so the poll/debounce loop keeps detecting
+        changes while the network is slow. Retries a couple of times with
+        exponential backoff before handing the failure to the circuit
+        breaker in next_interval.
+        """
+        delay = 2
+        for attempt in range(3):
+            try:
+                logger.info("Pushing to remote...")
+                self.run_git(["push"], capture=False)
+                logger.info("Push successful.")
+                self._ahead = False
+                self._consecutive_failures = 0
+                # The push owed nothing more; without this the on-disk
+                # ahead flag would stay stale until the next clean tick.
+                self._persist_state()
+                return
+            except Exception as e:
+                logger.error(f"Push failed (attempt {attempt + 1}/3): {e}")
+                if attempt < 2:
+                    time.sleep(delay)
+                    delay *= 2
+        self._ahead = True
+        self._consecutive_failures += 1
+        if self._consecutive_failures >= 3:
+            logger.error(f"Pushes keep failing. Backing off to {self.max_interval}s polls until one succeeds.")
 
     def commit_and_push_batches(self, files):
         """Commits and pushes files in chunks to avoid timeouts/buffer errors."""
@@ -271,65 +889,196 @@ class GitSync:
                 logger.info(f"Processing batch {i}/{num_batches} ({len(chunk)} files)...")
                 # Use individual add for each file in chunk to be safe
                 for file in chunk:
-                    self.run_git(["add", file], check=False)
+                    self.run_git(["add", file], check=False, capture=False)
                 
-                timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                self.run_git(["commit", "-m", f"Batch sync {i}/{num_batches}: {timestamp}"])
+                timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+                self.run_git(["commit", "-m", f"Batch sync {i}/{num_batches}: {timestamp}"], capture=False)
                 
                 # Push each batch
                 logger.info(f"Pushing batch {i}/{num_batches}...")
-                self.run_git(["push", "-u", "origin", "main"])
+                self.run_git(["push", "-u", "origin", "main"], capture=False)
                 logger.info(f"Batch {i} uploaded successfully.")
             except Exception as e:
                 logger.error(f"Failed at batch {i}: {e}")
                 logger.warning("Pausing for 5 seconds before next attempt...")
                 time.sleep(5)
 
+    def _head_ref(self):
+        """Returns the ref HEAD points at (e.g. refs/heads/main), or None."""
+        try:
+            with open(os.path.join(self._git_dir, "HEAD"), encoding="utf-8") as f:
+                head = f.read().strip()
+        except OSError:
+            return None
+        return head[5:] if head.startswith("ref: ") else None
+
+    def _read_ref(self, name):
+        """Resolves a ref to its SHA by reading .git directly (no subprocess).
+
+        Tries the loose ref file first, then packed-refs, whose parse is
+        cached and invalidated by mtime.
+        """
+        try:
+            with open(os.path.join(self._git_dir, name), encoding="utf-8") as f:
+                return f.read().strip()
+        except OSError:
+            pass
+        packed_path = os.path.join(self._git_dir, "packed-refs")
+        try:
+            mtime_ns = os.stat(packed_path).st_mtime_ns
+        except OSError:
+            return None
+        if self._packed_refs is None or self._packed_refs[0] != mtime_ns:
+            refs = {}
+            try:
+                with open(packed_path, encoding="utf-8") as f:
+                    for line in f:
+                        if line[:1] in ("#", "^"):
+                            continue
+                        sha, _, ref = line.strip().partition(" ")
+                        if ref:
+                            refs[ref] = sha
+            except OSError:
+                return None
+            self._packed_refs = (mtime_ns, refs)
+        return self._packed_refs[1].get(name)
+
     def pull_changes(self):
+        if self._is_detached_head():
+            return
         try:
-            self.run_git(["pull", "--rebase"], check=False)
+            # Fetch, then compare upstream to local by reading the refs
+            # straight from .git: the rebase spawn (and its index rewrite)
+            # only happens when the upstream actually moved.
+            self.run_git(["fetch"], check=False, discard_output=True)
+            self._last_pull = time.time()
+            head_ref = self._head_ref()
+            if head_ref and head_ref.startswith("refs/heads/"):
+                # Keep the full branch name: rpartition on "/" would chop
+                # slashed branches like feature/x down to x.
+                branch = head_ref[len("refs/heads/"):]
+                local = self._read_ref(head_ref)
+                remote = self._read_ref(f"refs/remotes/origin/{branch}")
+                if local is not None and local == remote:
+                    return  # Upstream unchanged and nothing local to replay.
+                self.run_git(["rebase", f"origin/{branch}"], check=False, discard_output=True)
+            else:
+                self.run_git(PULL_CMD, check=False, discard_output=True)
+            # A rebase onto new upstream commits can change ahead-ness;
+            # refresh it from the consolidated status call.
+            self.get_sync_state()
         except Exception:
             pass
 
+    @staticmethod
+    def _windowless_python():
+        """Finds pythonw.exe next to the real interpreter (no console flash).
+
+        sys._base_executable sees through venv redirection, and checking
+        the sibling file beats string-replacing "python.exe", which breaks
+        on versioned names like python3.11.exe.
+        """
+        base = getattr(sys, "_base_executable", None) or sys.executable
+        for exe in (sys.executable, base):
+            candidate = os.path.join(os.path.dirname(exe), "pythonw.exe")
+            if os.path.exists(candidate):
+                return candidate
+        return sys.executable
+
     def add_to_startup(self):
         """Adds the script to Windows startup."""
+        import platform
         if platform.system() != "Windows":
             logger.warning("Startup registration is only supported on Windows.")
             return
 
+        python_exe = self._windowless_python()
+        script_path = os.path.abspath(__file__)
+        cmd = f'"{python_exe}" "{script_path}" "{self.repo_path}" --idle_threshold {self.idle_threshold}'
+
+        # Prefer Task Scheduler: it starts the sync without the shell's
+        # startup-folder serialization and is visible/editable in taskschd.
+        try:
+            subprocess.run(
+                ["schtasks", "/Create", "/F", "/TN", "ObsidianGitSync",
+                 "/SC", "ONLOGON", "/TR", cmd],
+                check=True,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+            logger.info("Registered logon task via Task Scheduler.")
+            return
+        except Exception:
+            logger.warning("schtasks registration failed. Falling back to the Run key...")
+
         try:
             import winreg
             key_path = r"Software\Microsoft\Windows\CurrentVersion\Run"
-            key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, key_path, 0, winreg.KEY_SET_VALUE)
-            
-            python_exe = sys.executable.replace("python.exe", "pythonw.exe")
-            script_path = os.path.abspath(__file__)
-            cmd = f'"{python_exe}" "{script_path}" "{self.repo_path}" --idle_threshold {self.idle_threshold}'
-            
-            winreg.SetValueEx(key, "ObsidianGitSync", 0, winreg.REG_SZ, cmd)
-            winreg.CloseKey(key)
+            # KEY_WOW64_64KEY targets the real Run key even from 32-bit
+            # Python under WOW64, so the entry isn't registered twice.
+            with winreg.CreateKeyEx(winreg.HKEY_CURRENT_USER, key_path, 0,
+                                    winreg.KEY_SET_VALUE | winreg.KEY_WOW64_64KEY) as key:
+                winreg.SetValueEx(key, "ObsidianGitSync", 0, winreg.REG_SZ, cmd)
             logger.info("Successfully added to Windows Startup.")
         except Exception as e:
             logger.error(f"Failed to add to startup: {e}")
 
+def _json_loads(data):
+    """Parses JSON bytes via orjson when installed, stdlib json otherwise."""
+    if orjson is not None:
+        return orjson.loads(data)
+    import json
+    return json.loads(data)
+
+def _load_state():
+    """Loads the per-repo clean-snapshot state (empty dict when missing)."""
+    try:
+        with open(STATE_FILE, 'rb') as f:
+            return _json_loads(f.read())
+    except Exception:
+        return {}
+
+def _update_state(repo_path, snapshot, ahead):
+    """Persists one repo's clean snapshot. Compact dump; nobody edits this file."""
+    state = _load_state()
+    state[repo_path] = {"snapshot": list(snapshot), "ahead": ahead}
+    try:
+        if orjson is not None:
+            payload = orjson.dumps(state)
+        else:
+            import json
+            payload = json.dumps(state, separators=(',', ':')).encode('utf-8')
+        with open(STATE_FILE, 'wb') as f:
+            f.write(payload)
+    except Exception as e:
+        logger.debug(f"Could not persist sync state: {e}")
+
 def load_config():
     if os.path.exists(CONFIG_FILE):
         try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(CONFIG_FILE, 'rb') as f:
+                return _json_loads(f.read())
         except Exception as e:
             logger.error(f"Error loading config: {e}")
     return {}
 
 def save_config(config):
     try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4)
+        # Keep the file pretty-printed either way: the README documents it
+        # as hand-editable.
+        if orjson is not None:
+            payload = orjson.dumps(config, option=orjson.OPT_INDENT_2)
+        else:
+            import json
+            payload = json.dumps(config, indent=4).encode('utf-8')
+        with open(CONFIG_FILE, 'wb') as f:
+            f.write(payload)
         logger.info(f"Configuration saved to {CONFIG_FILE}")
     except Exception as e:
         logger.error(f"Error saving config: {e}")
 
 def main():
+    import argparse
     parser = argparse.ArgumentParser(description="Auto-sync Obsidian vault with GitHub.")
     parser.add_argument("--setup", action="store_true", help="Run interactive setup wizard.")
     parser.add_argument("--install-startup", action="store_true", help="Add to Windows startup.")
@@ -354,7 +1103,7 @@ def main():
         
         print("--- Obsidian Git Sync Setup ---")
         while not repo_path:
-            repo_path = input("Enter the absolute path to your Obsidian vault: ").strip()
+            repo_path = os.path.expanduser(input("Enter the absolute path to your Obsidian vault: ").strip())
             if not repo_path:
                 print("Path cannot be empty.")
         
@@ -369,7 +1118,23 @@ def main():
         save_config(config)
 
     syncer = GitSync(repo_path, idle_threshold, remote_url=remote_url)
-    
+
+    # Optional multi-vault support: extra entries under config["repos"].
+    syncers = [syncer]
+    for entry in config.get("repos", []):
+        extra_path = entry.get("repo_path")
+        if not extra_path or os.path.abspath(extra_path) == syncer.repo_path:
+            continue
+        extra = GitSync(
+            extra_path,
+            entry.get("idle_threshold", idle_threshold),
+            remote_url=entry.get("remote_url")
+        )
+        if not extra.is_git_repo():
+            logger.warning(f"Skipping {extra_path}: not a git repository.")
+            continue
+        syncers.append(extra)
+
     if args.repair:
         syncer.repair_connection()
         return
@@ -393,14 +1158,22 @@ def main():
     if args.install_startup:
         syncer.add_to_startup()
 
-    logger.info(f"Monitoring: {repo_path}")
+    # Identity is checked once here, before the loop starts - the tick path
+    # never touches it (and never blocks on an interactive prompt).
+    syncer.check_identity()
+    for s in syncers:
+        s.tune_repo_config()
+        logger.info(f"Monitoring: {s.repo_path}")
     logger.info(f"Idle Threshold: {idle_threshold}s")
     logger.info("Press Ctrl+C to stop.")
 
+    # git subprocesses release the GIL, so a small thread pool lets multiple
+    # vaults sync concurrently instead of serializing on the slowest one.
+    executor = ThreadPoolExecutor(max_workers=min(8, len(syncers)))
     try:
         while True:
-            syncer.sync()
-            time.sleep(syncer.interval)
+            list(executor.map(GitSync.sync, syncers))
+            time.sleep(min(s.next_interval() for s in syncers))
     except KeyboardInterrupt:
         logger.info("Stopping auto-sync.")
 